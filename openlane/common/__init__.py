@@ -20,7 +20,11 @@ A number of common utility functions and classes used throughout the codebase.
 import os
 
 from .tcl import TclUtils
-from .metrics import parse_metric_modifiers, aggregate_metrics
+from .metrics import (
+    parse_metric_modifiers,
+    aggregate_metrics,
+    aggregate_metrics_iter,
+)
 from . import metrics
 from .generic_dict import (
     GenericDictEncoder,
@@ -14,14 +14,24 @@
 from math import inf
 from decimal import Decimal
 from dataclasses import dataclass
-from typing import Any, Callable, Iterable, Mapping, Optional, Tuple, ClassVar, Dict
+from typing import (
+    Any,
+    Callable,
+    FrozenSet,
+    Iterable,
+    Mapping,
+    Optional,
+    Tuple,
+    ClassVar,
+    Dict,
+)
 
 
 from ..types import Number, is_number, is_real_number
 
 MetricAggregator = Tuple[Number, Callable[[Iterable[Number]], Number]]
 
-sum_aggregator: MetricAggregator = (0, lambda x: sum(x))
+sum_aggregator: MetricAggregator = (0, sum)
 min_aggregator: MetricAggregator = (inf, min)
 max_aggregator: MetricAggregator = (-inf, max)
 
@@ -115,6 +125,12 @@ class Metric(object):
     def __post_init__(self):
         Metric.by_name[self.name] = self
 
+    def __setattr__(self, name: str, value: Any):
+        super().__setattr__(name, value)
+        if name == "dont_aggregate":
+            # Kept in sync so aggregation can test membership cheaply
+            self._dont_aggregate: FrozenSet[str] = frozenset(value or ())
+
     def modified_name(self, modifiers: Mapping[str, str]) -> str:
         """
         :param modifiers: Modifiers of a metric (i.e. the elements postfixed to the metric in the format {key}:{value})
@@ -12,16 +12,21 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import re
+import operator
 import textwrap
 from enum import IntEnum
+from functools import lru_cache
+from types import MappingProxyType
 from dataclasses import dataclass
 from typing import (
+    Callable,
     List,
     Mapping,
     Tuple,
     Dict,
     Any,
     Iterable,
+    Iterator,
     Optional,
     Union,
 )
@@ -29,7 +34,17 @@ from typing import (
 from .metric import Metric, MetricAggregator, MetricComparisonResult
 from ..misc import Filter
 
-modifier_rx = re.compile(r"([\w\-]+)\:([\w\-]+)")
+modifier_rx = re.compile(r"([^:]*):(.*)", re.DOTALL)
+
+
+def _binary_reducer(reducer: Callable) -> Optional[Callable[[Any, Any], Any]]:
+    # Reducers that can fold in a single value without building a list.
+    # Compared by identity, as arbitrary reducers need not be hashable.
+    if reducer is sum:
+        return operator.add
+    if reducer is min or reducer is max:
+        return reducer
+    return None
 
 
 class TableVerbosity(IntEnum):
@@ -45,6 +60,7 @@ class TableVerbosity(IntEnum):
     ALL = 4
 
 
+@lru_cache(maxsize=4096)
 def parse_metric_modifiers(metric_name: str) -> Tuple[str, Mapping[str, str]]:
     """
     Parses a metric name into a base and modifiers as specified in
@@ -52,14 +68,18 @@ def parse_metric_modifiers(metric_name: str) -> Tuple[str, Mapping[str, str]]:
 
     :param metric_name: The name of the metric as generated by a utility.
     :returns: A tuple of the base part as a string, then the modifiers as
-        a key-value mapping.
+        a read-only key-value mapping.
     """
-    mn_mut = metric_name.split("__")
-    modifiers = {}
-    while ":" in mn_mut[-1]:
-        key, value = mn_mut.pop().split(":", maxsplit=1)
-        modifiers[key] = value
-    return "__".join(mn_mut), {k: modifiers[k] for k in reversed(modifiers)}
+    parts = metric_name.split("__")
+    kv_list: List[Tuple[str, str]] = []
+    i = len(parts) - 1
+    while i >= 0:
+        match = modifier_rx.fullmatch(parts[i])
+        if match is None:
+            break
+        kv_list.append((match[1], match[2]))
+        i -= 1
+    return "__".join(parts[: i + 1]), MappingProxyType(dict(reversed(kv_list)))
 
 
 def aggregate_metrics(
@@ -76,9 +96,38 @@ def aggregate_metrics(
     :param aggregator_by_metric: A mapping of metric names to either:
         - A tuple of the initial accumulator and reducer to aggregate the values from all modifier metrics
         - A :class:`Metric` class
-    :returns: A tuple of the base part as a string, then the modifiers as
-        a key-value mapping.
+    :returns: The input metrics, with the aggregated values added or
+        replaced.
     """
+    return {**input, **_aggregate(input, aggregator_by_metric)}
+
+
+def aggregate_metrics_iter(
+    input: Mapping[str, Any],
+    aggregator_by_metric: Optional[
+        Mapping[str, Union[MetricAggregator, Metric]]
+    ] = None,
+) -> Iterator[Tuple[str, Any]]:
+    """
+    Like :func:`aggregate_metrics`, but yields the resulting metrics as
+    key-value pairs instead of building a dictionary. Every name is yielded
+    exactly once, in the same order :func:`aggregate_metrics` would use.
+
+    :param input: A mapping of strings to values of metrics.
+    :param aggregator_by_metric: See :func:`aggregate_metrics`.
+    :returns: An iterator over the metric names and their values.
+    """
+    aggregated = _aggregate(input, aggregator_by_metric)
+    for name, value in input.items():
+        yield name, aggregated.pop(name, value)
+    yield from aggregated.items()
+
+
+def _aggregate(
+    input: Mapping[str, Any],
+    aggregator_by_metric: Optional[Mapping[str, Union[MetricAggregator, Metric]]],
+) -> Dict[str, Any]:
+    # Returns only the aggregated values, keyed by the aggregate's name
     if aggregator_by_metric is None:
         aggregator_by_metric = Metric.by_name
 
@@ -89,40 +138,76 @@ def aggregate_metrics(
             # No modifiers = final aggregate, don't double-represent in sums
             continue
 
-        modifier_names = list(modifiers.keys())
-        dont_aggregate: Iterable[str] = []
         entry = aggregator_by_metric.get(metric_name)
         if isinstance(entry, Metric):
-            dont_aggregate = entry.dont_aggregate or []
+            if not entry._dont_aggregate.isdisjoint(modifiers):
+                continue
             entry = entry.aggregator
 
         if entry is None:
             continue
 
-        if len(set(modifier_names).intersection(set(dont_aggregate))):
-            continue
+        # Every prefix of the name short of the full name is an aggregate
+        start, aggregation_fn = entry
+        prefixes = [metric_name]
+        for modifier, modifier_value in list(modifiers.items())[:-1]:
+            prefixes.append(f"{prefixes[-1]}__{modifier}:{modifier_value}")
+
+        if binary_fn := _binary_reducer(aggregation_fn):
+            for prefix in prefixes:
+                aggregated[prefix] = binary_fn(aggregated.get(prefix, start), value)
+        else:
+            for prefix in prefixes:
+                current = aggregated.get(prefix, start)
+                aggregated[prefix] = aggregation_fn([current, value])
 
-        metric_name_so_far = metric_name
-        for modifier in modifier_names:
-            start, aggregation_fn = entry
-            current = aggregated.get(metric_name_so_far) or start
-            aggregated[metric_name_so_far] = aggregation_fn([current, value])
-            metric_name_so_far += f"__{modifier}:{modifiers[modifier]}"
+    return aggregated
 
-    final_values = dict(input)
-    final_values.update(aggregated)
-    return final_values
 
+def _make_key_fn(fields: Iterable[str]) -> Callable[[str], Tuple[str, ...]]:
+    # An empty field refers to the base name, anything else to a modifier
+    names = list(fields)
+    wants_base = [name == "" for name in names]
 
-def _key_from_metrics(fields: Iterable[str], metric: str) -> List[str]:
-    base, modifiers = parse_metric_modifiers(metric)
-    result = []
-    for field in fields:
-        if field == "":
-            result.append(base)
+    def key_fn(metric: str) -> Tuple[str, ...]:
+        base, modifiers = parse_metric_modifiers(metric)
+        return tuple(
+            base if is_base else modifiers.get(name, "")
+            for is_base, name in zip(wants_base, names)
+        )
+
+    return key_fn
+
+
+def _classify(row: MetricComparisonResult) -> TableVerbosity:
+    # The lowest table verbosity at which this row is listed
+    if row.critical:
+        return TableVerbosity.CRITICAL
+    if row.better is False:
+        return TableVerbosity.WORSE
+    if row.is_changed():
+        return TableVerbosity.CHANGED
+    return TableVerbosity.ALL
+
+
+def _pick_emoji(row: MetricComparisonResult) -> str:
+    emoji = ""
+    if row.better is not None:
+        if row.better:
+            emoji = " ⭕"
         else:
-            result.append(modifiers.get(field, ""))
-    return result
+            emoji = " ❗"
+    if row.critical and row.is_changed():
+        emoji = " ‼️"
+    return emoji
+
+
+_TABLE_HEADER = textwrap.dedent(
+    f"""
+    | {'Metric':<70} | {'Before':<10} | {'After':<10} | {'Delta':<20} |
+    | {'-':<70} | {'-':<10} | {'-':<10} | {'-':<20} |
+    """
+)
 
 
 class MetricDiff(object):
@@ -152,10 +237,29 @@ class MetricDiff(object):
         critical: int = 0
         unchanged: int = 0
 
-    differences: List[MetricComparisonResult]
-
     def __init__(self, differences: Iterable[MetricComparisonResult]) -> None:
-        self.differences = list(differences)
+        self._differences = tuple(differences)
+        self._classified = bytearray(_classify(row) for row in self._differences)
+        self._formatted: List[Optional[Tuple[str, str, str, str]]] = [None] * len(
+            self._differences
+        )
+
+    @property
+    def differences(self) -> Tuple[MetricComparisonResult, ...]:
+        """
+        The metric comparison results. Read-only, as information derived from
+        them is cached.
+        """
+        return self._differences
+
+    def _format_row(self, i: int) -> Tuple[str, str, str, str]:
+        formatted = self._formatted[i]
+        if formatted is None:
+            row = self._differences[i]
+            before, after, delta = row.format_values()
+            formatted = (before, after, delta, _pick_emoji(row))
+            self._formatted[i] = formatted
+        return formatted
 
     def render_md(
         self,
@@ -171,68 +275,50 @@ class MetricDiff(object):
         if table_verbosity == TableVerbosity.NONE:
             return ""
 
-        differences = self.differences
-        if fields := sort_by:
-            differences = sorted(
-                differences,
-                key=lambda x: _key_from_metrics(fields, x.metric_name),  # type: ignore # (mypy bug)
-            )
+        # Only rows that will be listed are sorted
+        classified = self._classified
+        listed_differences = [
+            i for i, row_class in enumerate(classified) if row_class <= table_verbosity
+        ]
+        if len(listed_differences) == 0:
+            return ""
 
-        table = ""
-
-        changed = []
-        worse = []
-        critical = []
-        remaining = []
-
-        for row in differences:
-            if row.critical is True:
-                critical.append(row)
-            elif row.better is False:
-                worse.append(row)
-            elif row.is_changed():
-                changed.append(row)
-            else:
-                remaining.append(row)
-
-        listed_differences: List[MetricComparisonResult] = []
-        if table_verbosity >= TableVerbosity.CRITICAL:
-            listed_differences += critical
-        if table_verbosity >= TableVerbosity.WORSE:
-            listed_differences += worse
-        if table_verbosity >= TableVerbosity.CHANGED:
-            listed_differences += changed
-        if table_verbosity >= TableVerbosity.ALL:
-            listed_differences += remaining
-
-        if len(listed_differences) > 0:
-            table = textwrap.dedent(
-                f"""
-                | {'Metric':<70} | {'Before':<10} | {'After':<10} | {'Delta':<20} |
-                | {'-':<70} | {'-':<10} | {'-':<10} | {'-':<20} |
-                """
+        if sort_by:
+            key_fn = _make_key_fn(sort_by)
+            # Ties fall back to the original order of the rows
+            decorated = [
+                (classified[i], key_fn(self._differences[i].metric_name), i)
+                for i in listed_differences
+            ]
+            decorated.sort()
+            listed_differences = [t[2] for t in decorated]
+        else:
+            # Stable, so rows keep their original order within each class
+            listed_differences.sort(key=classified.__getitem__)
+
+        parts = [_TABLE_HEADER]
+        for i in listed_differences:
+            before, after, delta, emoji = self._format_row(i)
+            parts.append(
+                "| "
+                + self._differences[i].metric_name.ljust(70)
+                + " | "
+                + before.ljust(10)
+                + " | "
+                + after.ljust(10)
+                + " | "
+                + (delta + emoji).ljust(20)
+                + " |\n"
             )
 
-            for row in listed_differences:
-                before, after, delta = row.format_values()
-                emoji = ""
-                if row.better is not None:
-                    if row.better:
-                        emoji = " ⭕"
-                    else:
-                        emoji = " ❗"
-                if row.critical and row.is_changed():
-                    emoji = " ‼️"
-                table += f"| {row.metric_name:<70} | {before:<10} | {after:<10} | {f'{delta}{emoji}':<20} |\n"
-
-        return table
+        return "".join(parts)
 
     def stats(self) -> MetricStatistics:
         """
         :returns: A :class:`MetricStatistics` object based on this aggregate.
         """
         stats = MetricDiff.MetricStatistics()
-        for row in self.differences:
+        for row in self._differences:
             if not row.is_changed():
                 stats.unchanged += 1
             elif row.better is not None:
@@ -263,17 +349,22 @@ class MetricDiff(object):
         """
 
         def generator(g, n):
-            for metric in filter.filter(sorted(n.keys())):
-                if metric not in g:
-                    continue
+            smaller, larger = (n, g) if len(n) <= len(g) else (g, n)
+            common = [metric for metric in smaller if metric in larger]
+            # Sorted so the row order (and thus sort_by ties) is deterministic
+            for metric in sorted(filter.filter(common)):
                 base_metric, modifiers = parse_metric_modifiers(metric)
+                metric_object = Metric.by_name.get(base_metric)
+                if metric_object is None:
+                    continue
+
                 lhs_value, rhs_value = g[metric], n[metric]
-                if type(lhs_value) != type(rhs_value):
-                    lhs_value = type(rhs_value)(lhs_value)
+                rhs_class = rhs_value.__class__
+                if lhs_value.__class__ is not rhs_class:
+                    lhs_value = rhs_class(lhs_value)
 
-                if metric_object := Metric.by_name.get(base_metric):
-                    yield metric_object.compare(
-                        lhs_value, rhs_value, significant_figures, modifiers=modifiers
-                    )
+                yield metric_object.compare(
+                    lhs_value, rhs_value, significant_figures, modifiers=modifiers
+                )
 
         return MetricDiff(generator(gold, new))
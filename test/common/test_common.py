@@ -64,6 +64,14 @@ def test_parse_metric_modifiers():
         {"etc": "etc:etc"},
     ), "Improperly parsed metric with modifier containing a colon"
 
+    _, modifiers = parse_metric_modifiers("category__name__mod1:one")
+    with pytest.raises(TypeError):
+        modifiers["mod1"] = "two"  # type: ignore
+    assert parse_metric_modifiers("category__name__mod1:one") == (
+        "category__name",
+        {"mod1": "one"},
+    ), "Cached modifiers were mutated"
+
 
 @pytest.mark.parametrize(
     ("input", "aggregators", "expected"),
@@ -89,15 +97,190 @@ def test_parse_metric_modifiers():
                 "flower__max__height": Decimal("8.0"),
             },
         ),
+        (
+            {
+                "flower__min__height__type:roses": 0,
+                "flower__min__height__type:tulips": 5,
+                "flower__max__thorns__type:roses": 0,
+                "flower__max__thorns__type:tulips": -1,
+            },
+            {
+                "flower__min__height": (math.inf, lambda x: min(x)),
+                "flower__max__thorns": (-math.inf, lambda x: max(x)),
+            },
+            {
+                "flower__min__height__type:roses": 0,
+                "flower__min__height__type:tulips": 5,
+                "flower__min__height": 0,
+                "flower__max__thorns__type:roses": 0,
+                "flower__max__thorns__type:tulips": -1,
+                "flower__max__thorns": 0,
+            },
+        ),
+        (
+            {
+                "flower__min__height__type:roses": 0,
+                "flower__min__height__type:tulips": 5,
+                "flower__max__thorns__type:roses": 0,
+                "flower__max__thorns__type:tulips": -1,
+            },
+            {
+                "flower__min__height": (math.inf, min),
+                "flower__max__thorns": (-math.inf, max),
+            },
+            {
+                "flower__min__height__type:roses": 0,
+                "flower__min__height__type:tulips": 5,
+                "flower__min__height": 0,
+                "flower__max__thorns__type:roses": 0,
+                "flower__max__thorns__type:tulips": -1,
+                "flower__max__thorns": 0,
+            },
+        ),
+        (
+            {
+                "route__wirelength__iter:1": 5,
+                "route__wirelength__iter:2": 6,
+                "route__wirelength__corner:a": 3,
+            },
+            None,
+            {
+                "route__wirelength__iter:1": 5,
+                "route__wirelength__iter:2": 6,
+                "route__wirelength__corner:a": 3,
+                "route__wirelength": 3,
+            },
+        ),
     ],
 )
 def test_aggregate_metrics(input, aggregators, expected):
-    from openlane.common import aggregate_metrics
+    from openlane.common import aggregate_metrics, aggregate_metrics_iter
 
     assert (
         aggregate_metrics(input, aggregators) == expected
     ), "aggregate_metrics() returned unexpected output"
 
+    pairs = list(aggregate_metrics_iter(input, aggregators))
+    assert (
+        len(pairs) == len(expected) and dict(pairs) == expected
+    ), "aggregate_metrics_iter() returned unexpected output"
+
+
+def test_metric_dont_aggregate():
+    from dataclasses import fields
+    from openlane.common.metrics import Metric, aggregate_metrics
+
+    metric = Metric("test__dont_aggregate", aggregator=(0, sum))
+    try:
+        assert "_dont_aggregate" not in [
+            f.name for f in fields(metric)
+        ], "Internal state exposed as a dataclass field"
+
+        input = {"test__dont_aggregate__iter:1": 1}
+        assert (
+            aggregate_metrics(input)["test__dont_aggregate"] == 1
+        ), "Metric improperly not aggregated"
+
+        metric.dont_aggregate = ["iter"]
+        assert "test__dont_aggregate" not in aggregate_metrics(
+            input
+        ), "Reassigned dont_aggregate not respected"
+    finally:
+        del Metric.by_name[metric.name]
+
+
+def test_aggregate_metrics_unhashable_reducer():
+    from openlane.common import aggregate_metrics
+
+    class Reducer(object):
+        __hash__ = None  # type: ignore
+
+        def __call__(self, values):
+            return sum(values)
+
+    assert aggregate_metrics(
+        {"flower__count__type:roses": 1, "flower__count__type:tulips": 2},
+        {"flower__count": (0, Reducer())},
+    ) == {
+        "flower__count__type:roses": 1,
+        "flower__count__type:tulips": 2,
+        "flower__count": 3,
+    }, "aggregate_metrics() failed with an unhashable reducer"
+
+
+def test_metric_diff():
+    from openlane.common.metrics import MetricDiff
+    from openlane.common.metrics.util import TableVerbosity
+
+    gold = {
+        "design__instance__count": 10,
+        "design__die__area": 100,
+        "timing__setup__ws__corner:b": 1.0,
+        "timing__setup__ws__corner:a": 1.0,
+        "timing__hold_vio__count__corner:a": 0,
+    }
+    new = {
+        "design__instance__count": 12,
+        "design__die__area": 100,
+        "timing__setup__ws__corner:b": 2.0,
+        "timing__setup__ws__corner:a": 1.0,
+        "timing__hold_vio__count__corner:a": 1,
+    }
+    diff = MetricDiff.from_metrics(gold, new, 2)
+
+    assert diff.stats() == MetricDiff.MetricStatistics(
+        better=1,
+        worse=2,
+        critical=1,
+        unchanged=2,
+    ), "Improperly computed diff statistics"
+
+    from openlane.common.metrics import MetricComparisonResult
+
+    assert MetricDiff(
+        [
+            MetricComparisonResult("a", 1, 1, 0, 0, None, True, 2),
+            MetricComparisonResult("b", 1, 1, 0, 0, False, False, 2),
+        ]
+    ).stats() == MetricDiff.MetricStatistics(
+        critical=1,
+        unchanged=2,
+    ), "Improperly computed statistics for hand-built results"
+
+    def rows(table):
+        return [line.split("|")[1].strip() for line in table.splitlines()[3:]]
+
+    assert rows(diff.render_md(sort_by=("corner", ""))) == [
+        "timing__hold_vio__count__corner:a",
+        "design__instance__count",
+        "timing__setup__ws__corner:b",
+        "design__die__area",
+        "timing__setup__ws__corner:a",
+    ], "Improperly ordered table rows"
+
+    assert rows(
+        diff.render_md(sort_by=("corner", ""), table_verbosity=TableVerbosity.WORSE)
+    ) == [
+        "timing__hold_vio__count__corner:a",
+        "design__instance__count",
+    ], "Improperly filtered table rows"
+
+    assert "‼️" in diff.render_md(
+        table_verbosity=TableVerbosity.CRITICAL
+    ), "Critical change not marked"
+    assert (
+        diff.render_md(table_verbosity=TableVerbosity.NONE) == ""
+    ), "Table generated with verbosity NONE"
+    assert (
+        MetricDiff([]).render_md() == ""
+    ), "Table generated for empty set of differences"
+
+    assert diff.render_md(sort_by=("corner", "")) == diff.render_md(
+        sort_by=("corner", "")
+    ), "Repeated render produced a different table"
+    with pytest.raises(AttributeError):
+        diff.differences = []  # type: ignore
+
 
 def test_generic_dict():
     from openlane.common import GenericDict